@@ -1,6 +1,32 @@
 import pandas as pd
-import pickle
-import json
+import numpy as np
+import numbers
+
+def _dump_json(obj, file_name):
+    """Write obj to a .json file, using orjson if it is installed."""
+    try:
+        import orjson
+    except ImportError:
+        import json
+
+        with open(file_name, 'wt') as file:
+            json.dump(obj, file, separators = (',', ':'))
+    else:
+        with open(file_name, 'wb') as file:
+            file.write(orjson.dumps(obj, option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS))
+
+def _load_json(file_name):
+    """Read a .json file, using orjson if it is installed."""
+    try:
+        import orjson
+    except ImportError:
+        import json
+
+        with open(file_name, 'rt') as file:
+            return json.load(file)
+    else:
+        with open(file_name, 'rb') as file:
+            return orjson.loads(file.read())
 
 class account:
     """Object for storing an account.
@@ -12,10 +38,10 @@ class account:
             The date on which the account begins. (YYYY-MM-DD)
         to_date: str
             The date when the account ends. (YYYY-MM-DD)
-        val_at_open: float64
-            The value of the account at the beginning of from_date.
 
     Optional arguments:
+        val_at_open: float = 0.0
+            The value of the account at the beginning of from_date.
         format: list = ['Date', 'Reference', 'Value']
             A list of strings specifying the columns of a .csv file.
             Konto will use the 'Date' column to order, the 'Reference' value to sort and the 'Value' to process the transaction quantities.
@@ -23,39 +49,27 @@ class account:
             Whether or not the dates in the .csv are written with the day first.
         eval_on_value: list = []
             A list of references which should be tagged according to both rerence and value, not just reference. E.g. payments to paypal might fall under different categories and the price will be used to infer the tags.
+        chunksize: int = 500000
+            Number of rows of the .csv to read and clean at a time. Lower this to reduce peak memory on very large exports, or use None to read the .csv in one go.
     """
-    def __init__(self, file, from_date, to_date, val_at_open, format = ['Date', 'Reference', 'Value'], day_first = True, eval_on_value = []):
+    def __init__(self, file, from_date, to_date, val_at_open = 0.0, format = ['Date', 'Reference', 'Value'], day_first = True, eval_on_value = [], chunksize = 500000):
         # Error checking and importing
         if not(isinstance(file, str)):
             raise TypeError('file should be of type str.')
 
-        if not(isinstance(val_at_open, float64)):
-            raise TypeError('val_at_open should be a float64.')
-
-        try:
-            self.from_date = pd.to_datetime(from_date)
-        except TypeError:
-            print("from_date couldn't parse. Try using a string YYYY-MM-DD.")
-
-        try:
-            self.from_date = pd.to_datetime(from_date)
-        except TypeError:
-            print("to_date couldn't parse. Try using a string YYYY-MM-DD.")
-
-        # Get the DataFrame from the
-        self.data = pd.read_csv(file, parse_dates = ['Date'], dayfirst = day_first)
-        self.data.columns = format
+        if not(isinstance(val_at_open, numbers.Real)) or isinstance(val_at_open, bool):
+            raise TypeError('val_at_open should be a real number.')
 
-        # Initialise the datetime index.
-        self.data.set_index('Date', inplace = True)
+        self.from_date = pd.to_datetime(from_date, errors = 'coerce')
+        if pd.isna(self.from_date):
+            raise ValueError("from_date couldn't parse. Try using a string YYYY-MM-DD.")
 
-        # Make sure data types in the frame are correct.
-        self.data['Value'] = self.data['Value'].astype('str')
-        self.data['Value'] = self.data['Value'].str.replace(',','')
-        self.data = self.data.astype({'Reference': 'str', 'Value': 'float64'})
+        self.to_date = pd.to_datetime(to_date, errors = 'coerce')
+        if pd.isna(self.to_date):
+            raise ValueError("to_date couldn't parse. Try using a string YYYY-MM-DD.")
 
-        # Select only references and values.
-        self.sort_data = self.data[['Reference', 'Value']]
+        # Get the DataFrame from the .csv.
+        self.data = self._read_csv(file, format, day_first, chunksize)
 
         # Initialise the tagging dictionaries.
         self.tagdict = {}
@@ -65,13 +79,86 @@ class account:
         self.data_tagged = False
 
         # Save the value at opening.
-        self.val_at_open = val_at_open
-        self.value = self.val_at_open + self.data['Value'].sum()
+        self.val_at_open = float(val_at_open)
+        self.value = self.val_at_open + float(np.nansum(self.data['Value'].to_numpy()))
 
     # Explain how to print the data.
     def __str__(self):
         return self.data.__str__()
 
+    def _read_csv(self, file, format, day_first, chunksize):
+        """Read a .csv of transactions into a DataFrame indexed by date, a chunk at a time so large exports are cleaned as they are read."""
+        if chunksize is not None and (not(isinstance(chunksize, int)) or isinstance(chunksize, bool) or chunksize < 1):
+            raise ValueError('chunksize should be a positive int, or None to read the .csv in one go.')
+
+        reader = pd.read_csv(file, header = 0, names = format, parse_dates = ['Date'], dayfirst = day_first, dtype = {'Reference': 'str', 'Value': 'str'}, chunksize = chunksize)
+
+        # Without a chunksize the whole .csv comes back as a single DataFrame.
+        if chunksize is None:
+            reader = [reader]
+
+        pieces = []
+        for chunk in reader:
+            # Initialise the datetime index.
+            chunk.set_index('Date', inplace = True)
+
+            # Make sure data types in the frame are correct.
+            chunk['Value'] = pd.to_numeric(chunk['Value'].str.replace(',', '', regex = False)).astype('float64')
+            chunk['Reference'] = chunk['Reference'].fillna('')
+            pieces.append(chunk)
+
+        # Keep the transactions in date order, whichever way round the .csv was written.
+        data = pd.concat(pieces).sort_index(kind = 'stable')
+
+        # References repeat a lot, so store them as categories.
+        data['Reference'] = data['Reference'].astype('category')
+
+        return data
+
+    def _transaction_keys(self, data):
+        """Identify each transaction by its date, reference, value and how many identical transactions come before it."""
+        keys = pd.DataFrame({'Date': data.index, 'Reference': data['Reference'].astype('str').to_numpy(), 'Value': data['Value'].to_numpy()})
+        keys['Occurrence'] = keys.groupby(['Date', 'Reference', 'Value'], dropna = False).cumcount()
+        return pd.MultiIndex.from_frame(keys)
+
+    def endow(self, file, format = ['Date', 'Reference', 'Value'], day_first = True, chunksize = 500000):
+        """Add the transactions from another .csv to the account, so overlapping exports can be added safely. A new transaction is skipped only if the account already has a transaction with the same date, reference and value. Repeats are matched one for one, so two identical purchases in the .csv against one in the account keeps one of them.
+
+        Warning: the new transactions are untagged, use Account.tag() to tag them.
+
+        Arguments:
+            file: str
+                The .csv file to add to the account.
+
+        Optional arguments:
+            format: list = ['Date', 'Reference', 'Value']
+                A list of strings specifying the columns of the .csv file.
+            day_first: bool = True
+                Whether or not the dates in the .csv are written with the day first.
+            chunksize: int = 500000
+                Number of rows of the .csv to read and clean at a time, or None to read the .csv in one go.
+        """
+        if not(isinstance(file, str)):
+            raise TypeError('file should be of type str.')
+
+        new_data = self._read_csv(file, format, day_first, chunksize)
+
+        # Keep only the transactions not already in the account.
+        new_data = new_data[~self._transaction_keys(new_data).isin(self._transaction_keys(self.data))]
+        if new_data.empty:
+            return
+
+        self.data = pd.concat([self.data, new_data]).sort_index(kind = 'stable')
+        self.data['Reference'] = self.data['Reference'].astype('category')
+
+        # The new transactions need tagging, but keep the tag encoding in step with the reordered rows.
+        self.data_tagged = False
+        if 'Tags' in self.data:
+            self._encode_tags()
+
+        # Update the current account value.
+        self.value = self.value + float(np.nansum(new_data['Value'].to_numpy()))
+
     def tag(self,
             tagging_dict = None, tagging_dict_on_price = None):
         """Creates a new column 'tags' on the Account.data, allowing the user to summarise the account data. User will be prompted to enter tags, separated by a space, in order to tag the data. E.g.:
@@ -100,27 +187,41 @@ class account:
         self.tagdict = tagging_dict
         self.tagdict_on_price = tagging_dict_on_price
 
-        # Initialise the column of tag lists.
-        tagcolumn = []
+        references = self.data['Reference']
+        values = self.data['Value']
+
+        # References in the value dictionary are tagged on (reference, value), the rest on reference alone.
+        # Look up each distinct reference once and spread the result over the rows by category code.
+        codes = references.cat.codes.to_numpy()
+        categories = pd.Series(references.cat.categories)
+        on_price = np.append(categories.isin(list(self.tagdict_on_price)).to_numpy(), False)[codes]
+        tagcolumn = np.append(categories.map(self.tagdict).to_numpy(), None)[codes]
+
+        # Fill in the (reference, value) tags, looking up only the rows tagged on value.
+        if on_price.any():
+            priced = np.flatnonzero(on_price)
+            keys = zip(references.to_numpy()[priced], values.to_numpy()[priced])
+            tagcolumn[priced] = pd.Series([self.tagdict_on_price.get(key) for key in keys], dtype = object).to_numpy()
 
         # Prompt the user to label unlabelled data.
-        for i, row in self.sort_data.iterrows():
+        unlabelled = np.flatnonzero(pd.isna(tagcolumn))
+        for position, (i, ref, val) in zip(unlabelled, self.data[['Reference', 'Value']].iloc[unlabelled].itertuples(index = True, name = None)):
             tags_to_append = []
-            if row[0] in self.tagdict_on_price:
-                if (row[0], row[1]) in self.tagdict_on_price:
-                    tags_to_append = self.tagdict_on_price[(row[0], row[1])]
+            if on_price[position]:
+                if (ref, val) in self.tagdict_on_price:
+                    tags_to_append = self.tagdict_on_price[(ref, val)]
                 else:
-                    print(str(i) + ", " + str(row[0]) + ", " + str(row[1]) +    ":")
+                    print(f"{i}, {ref}, {val}:")
                     tags_to_append = input().split()
-                    tagdict_on_price[(row[0], row[1])] = tags_to_append
+                    self.tagdict_on_price[(ref, val)] = tags_to_append
             else:
-                if row[0] in self.tagdict:
-                    tags_to_append = self.tagdict[row[0]]
+                if ref in self.tagdict:
+                    tags_to_append = self.tagdict[ref]
                 else:
-                    print(str(i) + ", " + str(row[0]) + ", " + str(row[1])  + ":")
+                    print(f"{i}, {ref}, {val}:")
                     tags_to_append = input().split()
-                    self.tagdict[row[0]] = tags_to_append
-            tagcolumn.append(tags_to_append)
+                    self.tagdict[ref] = tags_to_append
+            tagcolumn[position] = tags_to_append
 
         # Update data_tagged.
         self.data_tagged = True
@@ -128,6 +229,16 @@ class account:
         # Send to a column.
         self.data['Tags'] = tagcolumn
 
+        self._encode_tags()
+
+    def _encode_tags(self):
+        """One-hot encode the 'Tags' column with a boolean column per tag, so tagresample can filter without a Python loop. Rows follow the order of Account.data, so call this again whenever the data is reordered."""
+        exploded = pd.Series(self.data['Tags'].to_numpy(), dtype = object).explode().dropna()
+        codes, tag_names = pd.factorize(exploded, sort = True)
+        onehot = np.zeros((len(self.data), len(tag_names)), dtype = bool)
+        onehot[exploded.index.to_numpy(), codes] = True
+        self._tag_onehot = pd.DataFrame(onehot, columns = tag_names)
+
     def resample(self, frequency = 'M'):
         """Resample the data using the given frequency.
 
@@ -169,7 +280,17 @@ class account:
         elif not(self.data_tagged):
             raise TagError('data has not yet been tagged. Please tag before using TagResample.')
 
-        self.last_resample = self.data[self.data['Tags'].apply(lambda tlist: set(list_of_tags).issubset(set(tlist)))].resample(frequency)['Value']
+        # The tag encoding is applied by position, so it must match the rows of the data.
+        if len(self._tag_onehot) != len(self.data):
+            raise ValueError('tag encoding is out of date with the data. Please tag again before using TagResample.')
+
+        # Select the rows which have every required tag.
+        if not set(list_of_tags).issubset(self._tag_onehot.columns):
+            mask = np.zeros(len(self.data), dtype = bool)
+        else:
+            mask = self._tag_onehot[list_of_tags].all(axis = 1).to_numpy()
+
+        self.last_resample = self.data.loc[mask].resample(frequency)['Value']
 
         return self.last_resample
 
@@ -180,8 +301,10 @@ class account:
             file_name: str
                 File name to write to.
         """
+        import pickle
+
         with open(file_name, 'wb') as file:
-            pickle.dump(self, file)
+            pickle.dump(self, file, protocol = pickle.HIGHEST_PROTOCOL)
 
 ### IMPORTING AND EXPORTING TAGS
 
@@ -192,18 +315,18 @@ class account:
             file_name: str
                 File name to write to.
         """
-        with open(file_name, 'wt') as file:
-            json.dump(self.tagdict, file)
+        _dump_json(self.tagdict, file_name)
 
     def export_value_tags(self, file_name):
         """Export the value tag dictionary to a .json.
 
+        The (reference, value) keys can't be .json keys, so the dictionary is written as a list of [key, tags] pairs.
+
         Arguments:
             file_name: str
                 File name to write to.
         """
-        with open(file_name, 'wt') as file:
-            json.dump(self.tagdict_on_price, file)
+        _dump_json([[key, tags] for key, tags in self.tagdict_on_price.items()], file_name)
 
     def import_tags(self, file_name):
         """Import the non-value tag dictionary from a .json to the local tagging dictionary.
@@ -214,8 +337,7 @@ class account:
             file_name: str
                 File name (json) to read from.
         """
-        with open(file_name, 'rt') as file:
-            self.tagdict = json.load(file)
+        self.tagdict = _load_json(file_name)
 
     def import_value_tags(self, file_name):
         """Import the value tag dictionary from a .json to the local tagging dictionary.
@@ -226,5 +348,5 @@ class account:
             file_name: str
                 File name (json) to read from.
         """
-        with open(file_name, 'rt') as file:
-            self.tagdict_on_price = json.load(file)
+        # Keys are stored as [reference, value] lists, so turn them back into tuples.
+        self.tagdict_on_price = {(tuple(key) if isinstance(key, list) else key): tags for key, tags in _load_json(file_name)}
@@ -14,10 +14,10 @@ class konto:
         self.account_list = account_list
 
         # Concatenate data from all listed accounts.
-        self.data = pd.concat([acc.data for acc in account_list]).sort_values('Date')
+        self.data = pd.concat([acc.data for acc in account_list], sort = False).sort_index(kind = 'stable')
 
         # Note whether or not the data has been tagged so far.
-        self.data_tagged = np.all([lambda acc: acc.data_tagged for acc in self.account_list])
+        self.data_tagged = all(getattr(acc, 'data_tagged', True) for acc in self.account_list)
 
         # Update the current konto value.
         self.value = sum([acc.value for acc in self.account_list])
@@ -63,7 +63,9 @@ class konto:
         elif not(self.data_tagged):
             raise TagError('data has not yet been tagged. Please tag all constituent accounts before using TagResample.')
 
-        self.last_resample = self.data[self.data['Tags'].apply(lambda tlist: set(list_of_tags).issubset(set(tlist)))].resample(frequency)['Value']
+        # Build the set of required tags once rather than for every row.
+        needed = frozenset(list_of_tags)
+        self.last_resample = self.data[self.data['Tags'].map(needed.issubset)].resample(frequency)['Value']
 
         return self.last_resample
 
@@ -74,5 +76,7 @@ class konto:
             file_name: str
                 File name to write to.
         """
+        import pickle
+
         with open(file_name, 'wb') as file:
-            pickle.dump(self, file)
+            pickle.dump(self, file, protocol = pickle.HIGHEST_PROTOCOL)
@@ -1,7 +1,6 @@
 import pandas as pd
 import numpy as np
-import pickle
-import json
+from concurrent.futures import ThreadPoolExecutor
 
 from Konto.Pools import konto
 
@@ -12,6 +11,8 @@ def load(file_name):
         file_name: str
             The name of the file to open.
     """
+    import pickle
+
     with open(file_name, 'rb') as file:
         account_to_return = pickle.load(file)
 
@@ -27,4 +28,8 @@ def bulk_load_accounts(list_of_account_filenames):
     Returns:
         konto: A konto consisting of the accounts.
     """
-    return konto([load(account_string) for account_string in list_of_account_filenames])
+    # The files are independent, so read them concurrently.
+    with ThreadPoolExecutor(max_workers = max(1, min(8, len(list_of_account_filenames)))) as executor:
+        accounts = list(executor.map(load, list_of_account_filenames))
+
+    return konto(accounts)